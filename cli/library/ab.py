@@ -74,10 +74,16 @@ options:
     default: no
 
 requirements:
-  - BeautifulSoup
   - ab (apache bench CLI utility)
 
 notes:
+  - "C(ab) reports the time per request twice. The mean per request is returned as
+    C(time per request), and the mean across all concurrent requests as
+    C(time per request (across all concurrent requests))."
+  - "The result includes a C(percentiles) dictionary, read from C(ab)'s C(-e) CSV output.
+    Its keys are the percentages C(0) to C(99) as strings, and each value is the time in
+    milliseconds (as a float) within which that percentage of requests were served.
+    C(0) is the fastest request; the longest request (100%) is not included."
   - Please be aware that a large number of concurrent workers can overwhelm either the
     webserver, the host on which the module is executing, or both. Use with caution only
     on webservers you control.
@@ -104,11 +110,31 @@ EXAMPLES = '''
 
 from ansible.module_utils.basic import AnsibleModule
 
+import csv
+import os
+import tempfile
+
+# RE2 matches in linear time without backtracking, so use it when it's
+# available. the pattern below sticks to syntax both engines understand.
 try:
-   from bs4 import BeautifulSoup
-   HAS_BEAUTIFUL_SOUP=True
+    import re2 as re
 except ImportError:
-   HAS_BEAUTIFUL_SOUP=False
+    import re
+
+# ab's plain text report is a block of "Label:   value" lines, followed by
+# the connection times table, which has min, mean, [+/-sd], median and max
+# columns for each row. a single pattern picks out both, so the report
+# only has to be scanned once. the text report follows some values with a
+# unit and annotation (e.g. "1953.12 [#/sec] (mean)"), which is left out of
+# the captured value so it's just the number, as it was in the HTML report.
+AB_REPORT_RE = re.compile(
+    r'(?m)^(?:'
+    r'(?P<row>Connect|Processing|Waiting|Total):\s+(?P<min>\d+)\s+(?P<avg>\d+)\s+\S+\s+\d+\s+(?P<max>\d+)'
+    r'|(?P<label>[A-Z][\w /-]*?):[ \t]+(?P<value>.*?)(?:[ \t]+\[[^\]\n]*\].*?)?[ \t]*$'
+    r')'
+)
+# the column labels used to build the "connection times" result keys
+TD_LABELS = ('Min.', 'Avg.', 'Max')
 
 def main():
     module = AnsibleModule(
@@ -133,8 +159,17 @@ def main():
     variable_length = module.params['variable_length']
 
     # now we build the argument list to be executed later, starting first
-    # with the ab_path we found with get_bin_path() above
-    args = [ab_path, '-n', str(request_count), '-c', str(workers), '-w']
+    # with the ab_path we found with get_bin_path() above. `-q` stops ab from
+    # printing its progress lines, which we'd only have to skip over anyway
+    args = [ab_path, '-q', '-n', str(request_count), '-c', str(workers)]
+
+    # ab can write a percentile table (0-99%) out as a CSV file with the `-e`
+    # flag, which is far simpler to read back than the text version.
+    # AnsibleModule will remove the file for us when we exit.
+    fd, percentiles_csv = tempfile.mkstemp(suffix='.csv')
+    os.close(fd)
+    module.add_cleanup_file(percentiles_csv)
+    args.extend(['-e', percentiles_csv])
 
     if keepalive:
         args.append('-k')
@@ -152,31 +187,38 @@ def main():
     # the ab connection times table printed at the end of the output
     result = {"connection times": dict()}
 
-    # parse the stdout data (which using the `-w` flag above is in HTML)
-    # so we use the BeautifulSoup module to pull the data out.
-    soup = BeautifulSoup(stdout, 'lxml')
-    for tr in soup.find_all('tr'):
-        if len(tr.find_all('th')) > 1:
-            continue
-        th = getattr(tr, 'th', None)
-        if th is None:
-            continue
-        if 'colspan' in th.attrs:
-            colspan = int(th.attrs['colspan'])
-            if colspan == 4:
+    # parse the stdout data, which is ab's plain text report. "Label: value"
+    # lines are only part of the summary before the connection times table;
+    # anything after it (such as ab's WARNING/ERROR sanity checks) isn't.
+    in_summary = True
+    for match in AB_REPORT_RE.finditer(stdout):
+        th_label = match.group('row')
+        if th_label is None:
+            if not in_summary:
                 continue
-            label = u' '.join(th.contents).lower()
-            if label[-1] == ':':
-                label = label[:-1]
-            result[label] = u' '.join(tr.td.contents)
-        else:
-            td_labels = ['Min.', 'Avg.', 'Max']
-            th_label = u' '.join(tr.th.contents)
-            for idx, item in enumerate(tr.find_all('td')):
-                label = ('%s %s' % (td_labels[idx], th_label)).lower()
-                if label[-1] == ':':
-                    label = label[:-1]
-                result["connection times"][label] = int(u' '.join(item.contents))
+            label = match.group('label').lower()
+            # ab prints "Time per request" twice, first the mean per request
+            # and then the mean across all concurrent requests
+            if label == 'time per request' and label in result:
+                label = '%s (across all concurrent requests)' % label
+            result[label] = match.group('value')
+            continue
+        in_summary = False
+        values = (match.group('min'), match.group('avg'), match.group('max'))
+        for td_label, item in zip(TD_LABELS, values):
+            label = ('%s %s' % (td_label, th_label)).lower()
+            result["connection times"][label] = int(item)
+
+    # the CSV file has a single header row, followed by one row per
+    # percentage (0 through 99, where 0 is the fastest request) holding the
+    # time (in ms) that percentage was served within
+    result["percentiles"] = dict()
+    with open(percentiles_csv) as f:
+        reader = csv.reader(f)
+        next(reader, None)
+        for row in reader:
+            if row:
+                result["percentiles"][row[0]] = float(row[1])
 
     # finally we return using a zero rc
     module.exit_json(**result)